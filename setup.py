@@ -42,6 +42,11 @@ setuptools.setup(
     author="AP Ljungquist",
     author_email="ap@ljungquist.eu",
     description=read_description(),
+    entry_points={
+        "console_scripts": [
+            f"{INSTALL_PACKAGE_NAME} = {INSTALL_PACKAGE_NAME}.cli:main"
+        ],
+    },
     extras_require=read_extras_require(),
     install_requires=read_install_requires(),
     long_description=read_readme(),
@@ -0,0 +1,117 @@
+"""Solver API for use with asyncio"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import AsyncIterator, Optional, Sequence, Tuple
+
+from diagv import optimization
+from diagv.core import GraphLike, compiled
+from diagv.typing_utils import HashableT
+
+_DONE = object()
+
+
+async def as_found(
+    digraph: GraphLike,
+    incumbent: Optional[Sequence[HashableT]] = None,
+    deadline: Optional[float] = None,
+    pause_every: int = 1000,
+    executor: Optional[concurrent.futures.ThreadPoolExecutor] = None,
+) -> AsyncIterator[Tuple[int, Tuple[HashableT, ...]]]:
+    """Like `optimization.as_found` but without blocking the event loop
+
+    Without an `executor` the search runs in the event loop and lets other tasks run
+    every `pause_every` expansions. With an `executor` the search runs in one of its
+    threads and the orderings are passed back to the event loop as they are found.
+    Either way the search stops soon after the iteration is cancelled or `deadline`,
+    a value of `time.monotonic`, passes.
+    """
+    if executor is None:
+        for found in optimization._as_found(digraph, incumbent, deadline, pause_every):
+            if found is None:
+                await asyncio.sleep(0)
+            else:
+                yield found
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The loop is closed so there is no one to tell
+            pass
+
+    def search():
+        try:
+            for found in optimization._as_found(
+                digraph, incumbent, deadline, pause_every
+            ):
+                if stopped.is_set():
+                    return
+                if found is not None:
+                    put(found)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    future = loop.run_in_executor(executor, search)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        await asyncio.shield(future)
+
+
+async def sorted_topological(
+    digraph: GraphLike,
+    solver: str = "search",
+    time_limit: Optional[float] = None,
+    pause_every: int = 1000,
+    executor: Optional[concurrent.futures.ThreadPoolExecutor] = None,
+) -> Tuple[HashableT, ...]:
+    """Like `optimization.sorted_topological` but without blocking the event loop
+
+    The search is run like `as_found` does. The MILP solver and the ordering of graphs
+    with cycles cannot pause so they are always run in `executor`, or the default
+    executor of the loop if None.
+    """
+    core = compiled(digraph)
+    loop = asyncio.get_running_loop()
+    if not core.is_acyclic():
+        return await loop.run_in_executor(
+            executor, optimization._sorted_cyclic, core, solver, time_limit
+        )
+    if solver == "milp":
+        from diagv import milp
+
+        solution = await loop.run_in_executor(executor, milp.solve, core, time_limit)
+        return solution.ordering
+    if solver != "search":
+        raise ValueError(f"Unknown solver {solver!r}")
+
+    incumbent = None
+    deadline = None
+    if time_limit is not None:
+        incumbent = [core.nodes[node] for node in core.topological_order()]
+        deadline = time.monotonic() + time_limit
+    best = None
+    async for found in as_found(core, incumbent, deadline, pause_every, executor):
+        if best is None or found[0] < best[0]:
+            best = found
+    assert best is not None
+    return best[1]
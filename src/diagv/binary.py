@@ -0,0 +1,152 @@
+"""Compact binary file format for graphs that can be loaded without copying
+
+The file starts with a header followed by these sections, each starting at a multiple
+of 8 bytes:
+
+- predecessor offsets, n + 1 little endian int64
+- predecessor indices, m little endian int32 or int64 as given by the header
+- successor offsets and indices, like the predecessors
+- label offsets, n + 1 little endian int64
+- labels, each encoded as JSON in UTF-8
+
+See `IndexedGraph` for how the offsets and indices represent edges.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+from typing import Any, BinaryIO, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from diagv.core import GraphLike, IndexedGraph, compiled
+
+MAGIC = b"DIAGVCSR"
+VERSION = 1
+# magic, version, bytes per index, number of nodes, edges and bytes of labels
+_HEADER = struct.Struct("<8sIIQQQ")
+_ALIGNMENT = 8
+_LABEL_TYPES = (str, int, float, bool, type(None))
+
+
+def write(graph: GraphLike, path: Union[str, os.PathLike]) -> None:
+    """Write `graph` to `path`
+
+    Node labels must be strings, numbers, booleans or None so that they can be read
+    back unchanged.
+    """
+    core = compiled(graph)
+    labels = []
+    for node in core.nodes:
+        if not isinstance(node, _LABEL_TYPES):
+            raise TypeError(f"Cannot store node {node!r} of type {type(node)}")
+        labels.append(json.dumps(node).encode())
+    label_offsets = np.cumsum([0] + [len(label) for label in labels], dtype="<i8")
+
+    index_dtype = np.dtype("<i4") if len(core) < 2**31 else np.dtype("<i8")
+    num_edges = len(core.pred_indices)
+    with open(path, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                index_dtype.itemsize,
+                len(core),
+                num_edges,
+                int(label_offsets[-1]),
+            )
+        )
+        for array, dtype in [
+            (core.pred_offsets, np.dtype("<i8")),
+            (core.pred_indices, index_dtype),
+            (core.succ_offsets, np.dtype("<i8")),
+            (core.succ_indices, index_dtype),
+            (label_offsets, np.dtype("<i8")),
+        ]:
+            _pad(f)
+            f.write(np.asarray(array, dtype=dtype).tobytes())
+        _pad(f)
+        for label in labels:
+            f.write(label)
+
+
+def read(path: Union[str, os.PathLike]) -> IndexedGraph:
+    """Return graph in `path` backed by memory mapped arrays
+
+    Nothing but the header is read up front; labels are decoded when accessed.
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError(f"{path} is too short to be a graph")
+    fields = _HEADER.unpack(header)
+    magic, version, index_size, num_nodes, num_edges, num_label_bytes = fields
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a graph")
+    if version != VERSION:
+        raise ValueError(f"{path} has unsupported version {version}")
+
+    index_dtype = np.dtype(f"<i{index_size}")
+    sections: List[Tuple[np.dtype, int]] = [
+        (np.dtype("<i8"), num_nodes + 1),
+        (index_dtype, num_edges),
+        (np.dtype("<i8"), num_nodes + 1),
+        (index_dtype, num_edges),
+        (np.dtype("<i8"), num_nodes + 1),
+        (np.dtype("u1"), num_label_bytes),
+    ]
+    arrays: List[Any] = []
+    offset = _HEADER.size
+    for dtype, length in sections:
+        offset = _aligned(offset)
+        if length:
+            # A plain view is much faster to slice than the memmap itself
+            mapped = np.memmap(path, dtype, "r", offset, (length,))
+            arrays.append(mapped.view(np.ndarray))
+        else:
+            arrays.append(np.empty(0, dtype))
+        offset += length * dtype.itemsize
+
+    pred_offsets, pred_indices, succ_offsets, succ_indices, label_offsets, blob = arrays
+    return IndexedGraph(
+        _Labels(label_offsets, blob),
+        pred_offsets,
+        pred_indices,
+        succ_offsets,
+        succ_indices,
+    )
+
+
+class _Labels(Sequence):
+    """Node labels decoded on demand"""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray) -> None:
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, stop = self._offsets[index], self._offsets[index + 1]
+        return json.loads(self._blob[start:stop].tobytes())
+
+    def __iter__(self) -> Iterator[object]:
+        return (self[i] for i in range(len(self)))
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _pad(f: BinaryIO) -> None:
+    position = f.tell()
+    f.write(bytes(_aligned(position) - position))
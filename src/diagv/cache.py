@@ -0,0 +1,240 @@
+"""Persistent cache of orderings found by the solver"""
+
+from __future__ import annotations
+
+import collections
+import dataclasses
+import hashlib
+import json
+import operator
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Dict, Generic, List, Optional, Sequence, Tuple, Union
+
+from diagv import optimization
+from diagv.core import GraphLike, IndexedGraph, compiled
+from diagv.typing_utils import HashableT
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orderings (
+    key TEXT PRIMARY KEY,
+    ordering TEXT NOT NULL,
+    cost INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedOrdering(Generic[HashableT]):
+    ordering: Tuple[HashableT, ...]
+    cost: int
+    # False if the search was interrupted before proving the ordering optimal
+    complete: bool
+
+
+class OrderingCache:
+    """Orderings stored in a SQLite database in `directory`
+
+    Entries are keyed by the structure of the graph, not its labels, so a graph that
+    is relabeled but otherwise unchanged can reuse the ordering of the original.
+    When the entries take up more than `max_bytes` the least recently used ones are
+    evicted.
+    """
+
+    def __init__(
+        self, directory: Union[str, os.PathLike], max_bytes: int = 16 * 2**20
+    ) -> None:
+        path = pathlib.Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._connection = sqlite3.connect(path / "orderings.sqlite3")
+        with self._connection:
+            self._connection.execute(_SCHEMA)
+
+    def __enter__(self) -> OrderingCache:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def get(self, digraph: GraphLike, **options) -> Optional[CachedOrdering]:
+        """Return the cached ordering for `digraph` if there is one"""
+        graph = compiled(digraph)
+        ranks = canonical_labeling(graph)
+        key = _key(graph, ranks, options)
+        with self._connection:
+            row = self._connection.execute(
+                "SELECT ordering, cost, complete FROM orderings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE orderings SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+
+        rank2node = [0] * len(graph)
+        for node, rank in enumerate(ranks):
+            rank2node[rank] = node
+        ordering = tuple(graph.nodes[rank2node[rank]] for rank in json.loads(row[0]))
+        return CachedOrdering(ordering, row[1], bool(row[2]))
+
+    def put(
+        self,
+        digraph: GraphLike,
+        ordering: Sequence[HashableT],
+        cost: int,
+        complete: bool,
+        **options,
+    ) -> None:
+        """Store `ordering` for `digraph`, replacing any previous entry"""
+        graph = compiled(digraph)
+        ranks = canonical_labeling(graph)
+        key = _key(graph, ranks, options)
+        text = json.dumps([ranks[graph.node2id[node]] for node in ordering])
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO orderings VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, cost, complete, len(key) + len(text), time.time()),
+            )
+            self._evict()
+
+    def sorted_topological(
+        self,
+        digraph: GraphLike,
+        solver: str = "search",
+        time_limit: Optional[float] = None,
+    ) -> Tuple[HashableT, ...]:
+        """Like `optimization.sorted_topological` but reusing and storing results
+
+        If the solver runs out of `time_limit` seconds the best ordering so far is
+        stored and, by the search, used as the starting point the next time the graph
+        is seen.
+
+        Orderings of graphs with cycles are neither looked up nor stored since there is
+        no cost to compare them by.
+        """
+        graph = compiled(digraph)
+        if not graph.is_acyclic():
+            return optimization._sorted_cyclic(graph, solver, time_limit)
+        cached = self.get(graph)
+        if cached is not None and cached.complete:
+            return cached.ordering
+
+        if solver == "milp":
+            from diagv import milp
+
+            solution = milp.solve(graph, time_limit)
+            cost, ordering = solution.cost, solution.ordering
+            complete = solution.optimal
+            if not complete and cached is not None and cached.cost < cost:
+                cost, ordering = cached.cost, cached.ordering
+        elif solver == "search":
+            deadline = None
+            incumbent: Optional[Sequence[HashableT]] = None
+            if cached is not None:
+                incumbent = cached.ordering
+            if time_limit is not None:
+                deadline = time.monotonic() + time_limit
+                if incumbent is None:
+                    incumbent = [
+                        graph.nodes[node] for node in graph.topological_order()
+                    ]
+
+            cost, ordering = min(
+                optimization.as_found(graph, incumbent, deadline),
+                key=operator.itemgetter(0),
+            )
+            complete = deadline is None or time.monotonic() < deadline
+        else:
+            raise ValueError(f"Unknown solver {solver!r}")
+        self.put(graph, ordering, cost, complete)
+        return ordering
+
+    def _evict(self) -> None:
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM orderings"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._connection.execute(
+            "SELECT key, size FROM orderings ORDER BY accessed"
+        ).fetchall()
+        for key, size in rows:
+            self._connection.execute("DELETE FROM orderings WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def canonical_labeling(graph: IndexedGraph) -> List[int]:
+    """Return a position for every node that does not depend on the node labels
+
+    Nodes are told apart by repeatedly refining their colors using the colors of
+    their neighbours. While some nodes remain indistinguishable, the first node of the
+    smallest class of such nodes is given a color of its own and the colors are
+    refined again. The result does not depend on which node of a class is picked as
+    long as all nodes in the class are interchangeable, which is almost always the
+    case. Otherwise some isomorphic graphs get different labelings, but two graphs
+    only ever share a canonical form if they are isomorphic.
+    """
+    colors = _refined(graph, [0] * len(graph))
+    while True:
+        color2nodes: Dict[int, List[int]] = collections.defaultdict(list)
+        for node, color in enumerate(colors):
+            color2nodes[color].append(node)
+        ties = [nodes for nodes in color2nodes.values() if len(nodes) > 1]
+        if not ties:
+            return colors
+        # Ties on size are broken by color, which does not depend on the labels
+        chosen = min(ties, key=lambda nodes: (len(nodes), colors[nodes[0]]))[0]
+        colors = [2 * color for color in colors]
+        colors[chosen] += 1
+        colors = _refined(graph, colors)
+
+
+def _refined(graph: IndexedGraph, colors: List[int]) -> List[int]:
+    """Return the coarsest refinement of `colors` where nodes of the same color have
+    the same number of predecessors and successors of each color
+
+    Colors are numbered from 0 in an order that depends only on the colors of the
+    nodes and their neighbours, not on the node ids.
+    """
+    num_colors = len(set(colors))
+    while True:
+        signatures = [
+            (
+                colors[node],
+                tuple(sorted(colors[pred] for pred in graph.predecessors(node))),
+                tuple(sorted(colors[succ] for succ in graph.successors(node))),
+            )
+            for node in range(len(graph))
+        ]
+        palette = {signature: i for i, signature in enumerate(sorted(set(signatures)))}
+        colors = [palette[signature] for signature in signatures]
+        if len(palette) == num_colors:
+            return colors
+        num_colors = len(palette)
+
+
+def _key(graph: IndexedGraph, ranks: Sequence[int], options: dict) -> str:
+    edges = sorted(
+        (ranks[pred], ranks[node])
+        for node in range(len(graph))
+        for pred in graph.predecessors(node)
+    )
+    payload = {
+        "solver_version": optimization.SOLVER_VERSION,
+        "options": options,
+        "nodes": len(graph),
+        "edges": edges,
+    }
+    text = json.dumps(payload, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
@@ -0,0 +1,341 @@
+"""Command line interface for laying out and drawing many graphs in parallel"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import json
+import os
+import pathlib
+import re
+import sys
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from diagv import optimization, visualization
+
+AdjacencyList = Dict[str, List[str]]
+# Either a graph or a description of why it could not be read
+Input = Union[AdjacencyList, str]
+# Either the ordering and drawing of a graph or a description of why there is none
+Result = Union[Tuple[List[str], str], str]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="diagv",
+        description="Find good orderings for directed graphs and draw them as text.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Files with one graph each; .json for an adjacency mapping, .dot or .gv"
+        " for DOT and anything else for an edge list with one edge per line. - or no"
+        " paths at all reads JSON lines from stdin.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes to use (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Seconds to spend on each graph before settling for the best so far",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=["search", "milp"],
+        default="search",
+        help="Algorithm to use (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["text", "json"],
+        default="text",
+        help="Output format, json gives one object per line (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    graphs = _read_paths(args.paths or ["-"])
+    num_failed = 0
+    for name, result in _solved(graphs, args.workers, args.solver, args.time_budget):
+        if isinstance(result, str):
+            print(f"{name}: {result}", file=sys.stderr)
+            num_failed += 1
+        else:
+            _write(sys.stdout, name, *result, args.format)
+        sys.stdout.flush()
+    return 1 if num_failed else 0
+
+
+def _solved(
+    graphs: Iterable[Tuple[str, Input]],
+    workers: int,
+    solver: str,
+    time_limit: Optional[float],
+) -> Iterator[Tuple[str, Result]]:
+    """Yield name and either ordering and drawing or error for graphs as they finish
+
+    At most a few graphs per worker are read ahead so that long streams can be
+    processed in constant memory.
+    """
+    if workers <= 1:
+        for name, graph in graphs:
+            if isinstance(graph, str):
+                yield name, graph
+            else:
+                yield name, _solve(graph, solver, time_limit)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending: Dict[concurrent.futures.Future, str] = {}
+        for name, graph in graphs:
+            if isinstance(graph, str):
+                yield name, graph
+                continue
+            pending[executor.submit(_solve, graph, solver, time_limit)] = name
+            if len(pending) < 4 * workers:
+                continue
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                yield pending.pop(future), future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield pending[future], future.result()
+
+
+def _solve(graph: AdjacencyList, solver: str, time_limit: Optional[float]) -> Result:
+    try:
+        ordering: Tuple[str, ...] = optimization.sorted_topological(
+            graph, solver, time_limit
+        )
+    except Exception as e:
+        # One graph that cannot be solved, for whatever reason, must not stop the rest
+        return _describe(e)
+    return list(ordering), visualization.text_art(graph, ordering)
+
+
+def _describe(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"
+
+
+def _write(
+    file: TextIO, name: str, ordering: List[str], drawing: str, fmt: str
+) -> None:
+    if fmt == "json":
+        record = {"name": name, "ordering": ordering, "text_art": drawing}
+        file.write(json.dumps(record) + "\n")
+    else:
+        file.write(f"# {name}\n{drawing}\n\n")
+
+
+def _read_file(path: pathlib.Path) -> AdjacencyList:
+    text = path.read_text()
+    if path.suffix == ".json":
+        return _from_json(json.loads(text))
+    if path.suffix in {".dot", ".gv"}:
+        return _from_dot(text)
+    return _from_edge_list(text)
+
+
+def _read_paths(paths: Iterable[str]) -> Iterator[Tuple[str, Input]]:
+    """Yield graphs from files, or from JSON lines on stdin for -"""
+    for path in paths:
+        if path == "-":
+            yield from _read_json_lines(sys.stdin)
+            continue
+        try:
+            yield path, _read_file(pathlib.Path(path))
+        except (OSError, ValueError) as e:
+            yield path, _describe(e)
+
+
+def _read_json_lines(file: TextIO) -> Iterator[Tuple[str, Input]]:
+    """Yield graphs from lines that are either adjacency mappings or objects with a
+    name and a graph"""
+    for i, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        name = f"<stdin>:{i}"
+        try:
+            record = json.loads(line)
+            if isinstance(record, dict) and "graph" in record:
+                name = str(record.get("name", name))
+                record = record["graph"]
+            yield name, _from_json(record)
+        except ValueError as e:
+            yield name, _describe(e)
+
+
+def _from_json(graph: object) -> AdjacencyList:
+    if not isinstance(graph, dict) or not all(
+        isinstance(succs, (list, str)) for succs in graph.values()
+    ):
+        raise ValueError("Expected an object mapping each node to a list of nodes")
+    return {str(node): [str(succ) for succ in succs] for node, succs in graph.items()}
+
+
+def _from_edge_list(text: str) -> AdjacencyList:
+    """Return graph from lines with a head and a tail, or only a node
+
+    >>> _from_edge_list("a b\\n# comment\\nb c\\nd")
+    {'a': ['b'], 'b': ['c'], 'd': []}
+    """
+    result: AdjacencyList = {}
+    for line in text.splitlines():
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) > 2:
+            raise ValueError(f"Expected at most two nodes per line but got {line!r}")
+        result.setdefault(fields[0], []).extend(fields[1:])
+    return result
+
+
+_DOT_TOKEN = re.compile(
+    r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/|(?:\A|\n)[ \t]*\#[^\n]*)
+    |(?P<space>\s+)
+    |(?P<quoted>"(?:[^"\\]|\\.)*")
+    |(?P<operator>->|--|[{}\[\];,=:])
+    |(?P<id>[^\W\d]\w*|-?(?:\.\d+|\d+(?:\.\d*)?))
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+_DOT_KEYWORDS = {"strict", "graph", "digraph", "node", "edge", "subgraph"}
+# A token and whether it is an ID, as opposed to a keyword or an operator
+_DotToken = Tuple[str, bool]
+
+
+def _from_dot(text: str) -> AdjacencyList:
+    """Return graph from the subset of DOT with node and edge statements
+
+    Attributes and ports are ignored. Subgraphs, undirected edges and HTML strings are
+    not supported and raise `ValueError`, as does anything else that is not
+    understood.
+
+    >>> _from_dot('digraph { a -> b -> "c d" [color=red]; e; rankdir=LR }')
+    {'a': ['b'], 'b': ['c d'], 'c d': [], 'e': []}
+    >>> _from_dot('graph { a -- b }')
+    Traceback (most recent call last):
+    ...
+    ValueError: Undirected graphs are not supported
+    """
+    tokens = _dot_tokens(text)[::-1]
+
+    def pop() -> _DotToken:
+        if not tokens:
+            raise ValueError("Unexpected end of graph")
+        return tokens.pop()
+
+    def peek() -> _DotToken:
+        return tokens[-1] if tokens else ("", False)
+
+    def pop_node() -> str:
+        token, is_id = pop()
+        if not is_id:
+            raise ValueError(f"Expected a node but got {token!r}")
+        # Ports only say where on the node an edge attaches
+        for _ in range(2):
+            if peek() == (":", False):
+                pop()
+                pop_node()
+        return token
+
+    def skip_attributes() -> None:
+        while peek() == ("[", False):
+            pop()
+            while peek() != ("]", False):
+                token, is_id = pop()
+                if not is_id and token not in {"=", ",", ";"}:
+                    raise ValueError(f"Unexpected {token!r} in attributes")
+            pop()
+
+    kind = pop()
+    if kind == ("strict", False):
+        kind = pop()
+    if kind == ("graph", False):
+        raise ValueError("Undirected graphs are not supported")
+    if kind != ("digraph", False):
+        raise ValueError(f"Expected a digraph but got {kind[0]!r}")
+    if peek()[1]:
+        pop()
+    if pop() != ("{", False):
+        raise ValueError("Expected a graph body enclosed in braces")
+
+    result: AdjacencyList = {}
+    while peek() != ("}", False):
+        token, is_id = peek()
+        if not is_id:
+            pop()
+            if token == ";":
+                continue
+            if token in {"{", "subgraph"}:
+                raise ValueError("Subgraphs are not supported")
+            if token in {"graph", "node", "edge"} and peek() == ("[", False):
+                skip_attributes()
+                continue
+            raise ValueError(f"Unexpected {token!r}")
+
+        if tokens[-2:-1] == [("=", False)]:
+            # Attribute of the graph
+            pop()
+            pop()
+            if not pop()[1]:
+                raise ValueError("Expected a value after =")
+            continue
+
+        nodes = [pop_node()]
+        while peek() in {("->", False), ("--", False)}:
+            if pop()[0] == "--":
+                raise ValueError("Undirected edges are not supported")
+            if peek() in {("{", False), ("subgraph", False)}:
+                raise ValueError("Subgraphs are not supported")
+            nodes.append(pop_node())
+        skip_attributes()
+        for head, tail in zip(nodes, nodes[1:]):
+            result.setdefault(head, []).append(tail)
+        for node in nodes:
+            result.setdefault(node, [])
+    pop()
+    if tokens:
+        raise ValueError(f"Unexpected {pop()[0]!r} after the graph")
+    return result
+
+
+def _dot_tokens(text: str) -> List[_DotToken]:
+    """Return the tokens of `text` with comments, whitespace and quotes removed"""
+    result = []
+    position = 0
+    while position < len(text):
+        match = _DOT_TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"Unexpected {text[position]!r} at position {position}")
+        position = match.end()
+        token = match.group()
+        if match.lastgroup == "quoted":
+            result.append((token[1:-1].replace('\\"', '"').replace("\\\n", ""), True))
+        elif match.lastgroup == "operator":
+            result.append((token, False))
+        elif match.lastgroup == "id":
+            if token.lower() in _DOT_KEYWORDS:
+                result.append((token.lower(), False))
+            else:
+                result.append((token, True))
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())
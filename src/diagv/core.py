@@ -0,0 +1,218 @@
+"""Integer indexed graph representation shared by optimization and visualization"""
+
+from __future__ import annotations
+
+import array
+import collections
+import functools
+import itertools
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Mapping,
+    Sequence,
+    Union,
+)
+
+from diagv.typing_utils import AdjacencyListT, HashableT
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+class IndexedGraph(Generic[HashableT]):
+    """Directed graph with nodes numbered 0..n-1 and edges stored CSR style
+
+    The direct predecessors of node ``i`` are
+    ``pred_indices[pred_offsets[i]:pred_offsets[i + 1]]`` and likewise for the
+    direct successors. ``nodes[i]`` is the original node that ``i`` represents.
+
+    >>> graph = compiled({"a": "bc", "b": "c"})
+    >>> graph.nodes
+    ('a', 'b', 'c')
+    >>> list(graph.predecessors(2)), list(graph.successors(0))
+    ([0, 1], [1, 2])
+    """
+
+    def __init__(
+        self,
+        nodes: Sequence[HashableT],
+        pred_offsets: Sequence[int],
+        pred_indices: Sequence[int],
+        succ_offsets: Sequence[int],
+        succ_indices: Sequence[int],
+    ) -> None:
+        self.nodes = nodes
+        self.pred_offsets = pred_offsets
+        self.pred_indices = pred_indices
+        self.succ_offsets = succ_offsets
+        self.succ_indices = succ_indices
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @functools.cached_property
+    def node2id(self) -> Dict[HashableT, int]:
+        return {node: i for i, node in enumerate(self.nodes)}
+
+    def predecessors(self, node: int) -> Sequence[int]:
+        """Return direct predecessors of `node`"""
+        return self.pred_indices[self.pred_offsets[node] : self.pred_offsets[node + 1]]
+
+    def successors(self, node: int) -> Sequence[int]:
+        """Return direct successors of `node`"""
+        return self.succ_indices[self.succ_offsets[node] : self.succ_offsets[node + 1]]
+
+    def topological_order(self) -> List[int]:
+        """Return nodes ordered so that every node comes after its predecessors
+
+        Raises `NotImplementedError` if the graph has a cycle.
+        """
+        pred_offsets = _to_list(self.pred_offsets)
+        succ_offsets = _to_list(self.succ_offsets)
+        succ_indices = _to_list(self.succ_indices)
+        in_degrees = [
+            stop - start for start, stop in zip(pred_offsets, pred_offsets[1:])
+        ]
+        remaining = collections.deque(i for i, d in enumerate(in_degrees) if not d)
+        result = []
+        while remaining:
+            node = remaining.popleft()
+            result.append(node)
+            for successor in succ_indices[succ_offsets[node] : succ_offsets[node + 1]]:
+                in_degrees[successor] -= 1
+                if not in_degrees[successor]:
+                    remaining.append(successor)
+        if len(result) < len(self):
+            raise NotImplementedError("Only DAGs are supported so far")
+        return result
+
+    def is_acyclic(self) -> bool:
+        try:
+            self.topological_order()
+        except NotImplementedError:
+            return False
+        return True
+
+    def strongly_connected_components(self) -> List[List[int]]:
+        """Return groups of nodes that can all reach each other
+
+        Components are returned in reverse topological order and nodes within each
+        component in the order they were discovered.
+
+        >>> graph = compiled({"a": "b", "b": "ac", "c": ""})
+        >>> graph.strongly_connected_components()
+        [[2], [0, 1]]
+        """
+        # Tarjan's algorithm with an explicit stack to support deep graphs
+        succ_offsets = _to_list(self.succ_offsets)
+        succ_indices = _to_list(self.succ_indices)
+        index = [-1] * len(self)
+        lowlink = [0] * len(self)
+        on_stack = [False] * len(self)
+        stack: List[int] = []
+        result: List[List[int]] = []
+        counter = 0
+        for root in range(len(self)):
+            if index[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, i = work.pop()
+                if i == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+                if succ_offsets[node] + i < succ_offsets[node + 1]:
+                    work.append((node, i + 1))
+                    successor = succ_indices[succ_offsets[node] + i]
+                    if index[successor] == -1:
+                        work.append((successor, 0))
+                    elif on_stack[successor]:
+                        lowlink[node] = min(lowlink[node], index[successor])
+                    continue
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    result.append(component[::-1])
+        return result
+
+    @classmethod
+    def from_predecessor_lists(
+        cls, nodes: Sequence[HashableT], pred_lists: Iterable[Iterable[int]]
+    ) -> IndexedGraph[HashableT]:
+        """Return graph given the direct predecessors of each node by index"""
+        pred_offsets = array.array("q", [0])
+        pred_indices = array.array("q")
+        succ_lists: List[List[int]] = [[] for _ in nodes]
+        for node, preds in enumerate(pred_lists):
+            for pred in dict.fromkeys(preds):
+                pred_indices.append(pred)
+                succ_lists[pred].append(node)
+            pred_offsets.append(len(pred_indices))
+
+        succ_offsets = array.array("q", [0])
+        succ_indices = array.array("q")
+        for succs in succ_lists:
+            succ_indices.extend(succs)
+            succ_offsets.append(len(succ_indices))
+        return cls(tuple(nodes), pred_offsets, pred_indices, succ_offsets, succ_indices)
+
+    @classmethod
+    def from_digraph(cls, digraph: nx.DiGraph) -> IndexedGraph:
+        """Return graph equivalent to a networkx directed graph
+
+        Only the ``pred`` attribute is used so networkx itself is never imported.
+        """
+        nodes = list(digraph)
+        node2id = {node: i for i, node in enumerate(nodes)}
+        return cls.from_predecessor_lists(
+            nodes, ([node2id[pred] for pred in digraph.pred[node]] for node in nodes)
+        )
+
+    @classmethod
+    def from_adjacency(
+        cls, graph: AdjacencyListT[HashableT]
+    ) -> IndexedGraph[HashableT]:
+        """Return graph given a mapping from each node to its direct successors"""
+        graph = {node: list(successors) for node, successors in graph.items()}
+        nodes = list(dict.fromkeys(itertools.chain(graph, *graph.values())))
+        node2id = {node: i for i, node in enumerate(nodes)}
+        pred_lists: List[List[int]] = [[] for _ in nodes]
+        for node, successors in graph.items():
+            for successor in successors:
+                pred_lists[node2id[successor]].append(node2id[node])
+        return cls.from_predecessor_lists(nodes, pred_lists)
+
+
+GraphLike = Union[IndexedGraph, "nx.DiGraph", AdjacencyListT]
+
+
+def _to_list(values: Sequence[int]) -> List[int]:
+    """Return `values` as a list, which is faster to index than arrays
+
+    Both `array.array` and numpy arrays convert themselves to Python ints in one go.
+    """
+    tolist = getattr(values, "tolist", None)
+    return list(values) if tolist is None else tolist()
+
+
+def compiled(graph: GraphLike) -> IndexedGraph:
+    """Return `graph` as an `IndexedGraph`, converting it only if needed"""
+    if isinstance(graph, IndexedGraph):
+        return graph
+    if isinstance(graph, Mapping):
+        return IndexedGraph.from_adjacency(graph)
+    return IndexedGraph.from_digraph(graph)
@@ -0,0 +1,238 @@
+"""Exact solver that formulates the ordering problem as a mixed integer linear program
+
+Requires scipy, which bundles the HiGHS solver.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import itertools
+import math
+from typing import Dict, Generic, List, Optional, Tuple
+
+from diagv import misc, optimization
+from diagv.core import GraphLike, compiled
+from diagv.typing_utils import HashableT
+
+# A linear expression as coefficient per variable and a constant term
+_Expression = Tuple[Dict[int, float], float]
+
+
+@dataclasses.dataclass(frozen=True)
+class Solution(Generic[HashableT]):
+    ordering: Tuple[HashableT, ...]
+    cost: int
+    # No ordering has a lower cost than this
+    lower_bound: int
+
+    @property
+    def optimal(self) -> bool:
+        return self.cost <= self.lower_bound
+
+
+def solve(digraph: GraphLike, time_limit: Optional[float] = None) -> Solution:
+    """Return an optimal topological ordering, or the best found within `time_limit`
+
+    The cost is the same as `optimization.cost` but expressed using one binary
+    variable per pair of nodes telling which of them comes first.
+    """
+    from scipy import optimize, sparse
+
+    core = compiled(digraph)
+    misc.raise_for_cyclic(core)
+    g = optimization._Graph(core)
+    program = _Program(g)
+    program.add_cost()
+
+    if not program.objective:
+        # There is at most one node so there is nothing to choose, and scipy does not
+        # accept programs without variables
+        ordering = tuple(core.nodes[node] for node in core.topological_order())
+        return Solution(ordering, 0, 0)
+
+    num_variables = len(program.objective)
+    constraints = sparse.coo_matrix(
+        (program.values, (program.rows, program.cols)),
+        shape=(len(program.lower), num_variables),
+    )
+    options = {} if time_limit is None else {"time_limit": time_limit}
+    result = optimize.milp(
+        program.objective,
+        integrality=program.integrality,
+        bounds=optimize.Bounds(program.var_lower, program.var_upper),
+        constraints=optimize.LinearConstraint(
+            constraints.tocsr(), program.lower, program.upper
+        ),
+        options=options,
+    )
+
+    if result.x is None:
+        order = tuple(core.topological_order())
+    else:
+        order = program.ordering(result.x)
+    cost = optimization._primed_cost(g, order)
+    lower_bound = 0
+    if result.mip_dual_bound is not None and math.isfinite(result.mip_dual_bound):
+        # The cost is integral so the bound can be rounded up, with some slack for
+        # the tolerances of the solver
+        lower_bound = math.ceil(result.mip_dual_bound + program.constant - 1e-6)
+    return Solution(
+        tuple(core.nodes[node] for node in order), cost, min(cost, lower_bound)
+    )
+
+
+class _Program:
+    """Mixed integer linear program under construction"""
+
+    def __init__(self, g: optimization._Graph) -> None:
+        self.g = g
+        self.objective: List[float] = []
+        self.constant = 0.0
+        self.integrality: List[int] = []
+        self.var_lower: List[float] = []
+        self.var_upper: List[float] = []
+        self.rows: List[int] = []
+        self.cols: List[int] = []
+        self.values: List[float] = []
+        self.lower: List[float] = []
+        self.upper: List[float] = []
+
+        # One binary variable per pair telling if the node with lowest id is first
+        self.pair2var: Dict[Tuple[int, int], int] = {}
+        for i, j in itertools.combinations(g.nodes, 2):
+            if i in g.node2predecessors[j]:
+                fixed: Optional[int] = 1
+            elif j in g.node2predecessors[i]:
+                fixed = 0
+            else:
+                fixed = None
+            self.pair2var[i, j] = self.add_variable(
+                integral=True,
+                lower=0 if fixed is None else fixed,
+                upper=1 if fixed is None else fixed,
+            )
+
+        # Any assignment without 3-cycles is a total order
+        for i, j, k in itertools.combinations(g.nodes, 3):
+            ij, jk, ik = self.pair2var[i, j], self.pair2var[j, k], self.pair2var[i, k]
+            if not all(self.var_lower[v] == self.var_upper[v] for v in (ij, jk, ik)):
+                self.add_constraint({ij: 1, jk: 1, ik: -1}, 0, 1)
+
+    def add_variable(self, integral: bool, lower: float, upper: float) -> int:
+        self.objective.append(0)
+        self.integrality.append(int(integral))
+        self.var_lower.append(lower)
+        self.var_upper.append(upper)
+        return len(self.objective) - 1
+
+    def add_constraint(self, coefs: Dict[int, float], lower: float, upper: float):
+        row = len(self.lower)
+        for col, value in coefs.items():
+            self.rows.append(row)
+            self.cols.append(col)
+            self.values.append(value)
+        self.lower.append(lower)
+        self.upper.append(upper)
+
+    def add_to_objective(self, expression: _Expression) -> None:
+        coefs, constant = expression
+        for var, coef in coefs.items():
+            self.objective[var] += coef
+        self.constant += constant
+
+    def before(self, a: int, b: int) -> _Expression:
+        """Return expression that is 1 if `a` comes before `b` and 0 otherwise"""
+        if a < b:
+            return {self.pair2var[a, b]: 1}, 0
+        return {self.pair2var[b, a]: -1}, 1
+
+    def any_before(self, pairs: List[Tuple[int, int]]) -> int:
+        """Return variable that is at least 1 if any `a` comes before its `b`
+
+        Since the objective is minimized it will be 0 when no `a` does.
+        """
+        result = self.add_variable(integral=False, lower=0, upper=1)
+        for a, b in pairs:
+            coefs, constant = self.before(a, b)
+            self.add_constraint(
+                {result: 1, **{var: -coef for var, coef in coefs.items()}},
+                constant,
+                math.inf,
+            )
+        return result
+
+    def add_cost(self) -> None:
+        g = self.g
+        # Every node between the ends of an edge makes it one step longer. The ends
+        # themselves contribute nothing since a predecessor is always first.
+        for node in g.nodes:
+            for pred in g.node2direct_predecessors[node]:
+                for other in g.nodes:
+                    if other not in (node, pred):
+                        self.add_to_objective(self.before(other, node))
+                        coefs, constant = self.before(other, pred)
+                        self.add_to_objective(
+                            ({var: -coef for var, coef in coefs.items()}, -constant)
+                        )
+
+        # An edge (x, r) passing over an edge ending in w crosses it, which happens
+        # when x is after the first direct predecessor p of w but before w, and r is
+        # after w.
+        for w in g.nodes:
+            dpreds = g.node2direct_predecessors[w]
+            if not dpreds:
+                continue
+            for x in g.nodes:
+                if x == w or x in dpreds or x in g.node2successors[w]:
+                    continue
+                dsuccs = g.node2direct_successors[x]
+                # Each condition is either known to hold (None), known to never hold
+                # (continue) or a variable that is 1 when it holds
+                if any(p in g.node2predecessors[x] for p in dpreds):
+                    after_dpred = None
+                elif all(p in g.node2successors[x] for p in dpreds):
+                    continue
+                else:
+                    after_dpred = self.any_before([(p, x) for p in dpreds])
+                if any(r in g.node2successors[w] for r in dsuccs):
+                    before_dsucc = None
+                elif all(r in g.node2predecessors[w] for r in dsuccs):
+                    continue
+                else:
+                    before_dsucc = self.any_before([(w, r) for r in dsuccs])
+
+                if x in g.node2predecessors[w]:
+                    before_w: _Expression = ({}, 1)
+                else:
+                    before_w = self.before(x, w)
+
+                # crossing >= after_dpred + before_w + before_dsucc - 2
+                lhs: Dict[int, float] = {}
+                rhs = -2.0
+                for var in (after_dpred, before_dsucc):
+                    if var is None:
+                        rhs += 1
+                    else:
+                        lhs[var] = -1
+                for var, coef in before_w[0].items():
+                    lhs[var] = -coef
+                rhs += before_w[1]
+
+                if not lhs:
+                    self.add_to_objective(({}, 1))
+                    continue
+                crossing = self.add_variable(integral=False, lower=0, upper=1)
+                self.objective[crossing] = 1
+                self.add_constraint({crossing: 1, **lhs}, rhs, math.inf)
+
+    def ordering(self, solution) -> Tuple[int, ...]:
+        """Return ordering encoded by the pair variables in `solution`"""
+
+        def position(node):
+            return sum(
+                round(solution[var]) if node == j else 1 - round(solution[var])
+                for (i, j), var in self.pair2var.items()
+                if node in (i, j)
+            )
+
+        return tuple(sorted(self.g.nodes, key=position))
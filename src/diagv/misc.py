@@ -1,15 +1,21 @@
-import networkx as nx
+from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
+from diagv import core
+from diagv.core import GraphLike
 from diagv.typing_utils import AdjacencyListT
 
+if TYPE_CHECKING:
+    import networkx as nx
+
 
 def digraph(graph: AdjacencyListT, order=1) -> nx.DiGraph:
+    import networkx as nx
+
     return nx.DiGraph((k, v)[::order] for k, vs in graph.items() for v in vs)
 
 
-def raise_for_cyclic(digraph: nx.DiGraph) -> None:
-    try:
-        nx.find_cycle(digraph)
-    except nx.NetworkXNoCycle:
-        return
-    raise NotImplementedError("Only DAGs are supported so far")
+def raise_for_cyclic(digraph: GraphLike) -> None:
+    if not core.compiled(digraph).is_acyclic():
+        raise NotImplementedError("Only DAGs are supported so far")
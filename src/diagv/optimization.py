@@ -1,118 +1,112 @@
 """Functionality to visualize apps"""
+
 from __future__ import annotations
 
 import collections
 import functools
+import heapq
 import itertools
 import math
 import operator
-from typing import Callable, Dict, FrozenSet, Generic, Iterator, Sequence, Set, Tuple
-
-import more_itertools
-import networkx as nx
+import time
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 from diagv import misc
-from diagv.typing_utils import AdjacencyListT, HashableT, NormalizedAdjacencyList
-
-
-def _nodes(graph: AdjacencyListT[HashableT]) -> Iterator[HashableT]:
-    """Yield nodes in graph in reproducible order"""
-    return more_itertools.unique_everseen(itertools.chain(graph, *graph.values()))
-
+from diagv.core import GraphLike, IndexedGraph, compiled
+from diagv.typing_utils import HashableT
 
-def _normalized(
-    graph: AdjacencyListT[HashableT],
-) -> NormalizedAdjacencyList[HashableT]:
-    """Return graph in form that is amenable to many computations"""
-    return {node: set(graph.get(node, [])) for node in _nodes(graph)}
+# Bump when a change means that previously returned orderings may no longer be optimal
+SOLVER_VERSION = 1
 
 
-def _inverted(
-    graph: AdjacencyListT[HashableT],
-) -> NormalizedAdjacencyList[HashableT]:
-    """Return graph with all arrows reverted"""
-    result: NormalizedAdjacencyList[HashableT] = {node: set() for node in _nodes(graph)}
-    for node in result:
-        for adjacent in graph.get(node, []):
-            result[adjacent].add(node)
-    return result
-
-
-def _reachables(
-    graph: AdjacencyListT[HashableT], origin: HashableT
-) -> Iterator[HashableT]:
+def _reachables(graph: Sequence[FrozenSet[int]], origin: int) -> Iterator[int]:
     """Yield all nodes that are reachable from `origin`"""
-    done: Set[HashableT] = set()
-    remaining = collections.deque(graph.get(origin, []))
+    done: Set[int] = set()
+    remaining = collections.deque(graph[origin])
     while remaining:
         node = remaining.popleft()
         yield node
         if node not in done:
             done.add(node)
-            remaining.extend(graph.get(node, []))
+            remaining.extend(graph[node])
 
 
-def _reachability(
-    graph: AdjacencyListT[HashableT],
-) -> Dict[HashableT, Set[HashableT]]:
-    """Return mapping from each node to all its descendants"""
-    return {node: set(_reachables(graph, node)) for node in graph}
+def _reachability(graph: Sequence[FrozenSet[int]]) -> List[Set[int]]:
+    """Return list mapping each node to all its descendants"""
+    return [set(_reachables(graph, node)) for node in range(len(graph))]
 
 
-class _Graph(Generic[HashableT]):
+class _Graph:
     """Precomputed collection of graph properties
 
     These are frequently accessed by the algorithms and having them precomputed speeds
-    up execution.
+    up execution. Nodes are the integer ids of `core`.
     """
 
-    def __init__(self, graph: AdjacencyListT[HashableT]) -> None:
-        self.nodes = list(
-            more_itertools.unique_everseen(itertools.chain(graph, *graph.values()))
-        )
+    def __init__(self, core: IndexedGraph) -> None:
+        self.core = core
+        self.nodes = list(range(len(core)))
         self.nodes_set = frozenset(self.nodes)
-        self.node2direct_predecessors = _normalized(graph)
-        self.node2direct_successors = _inverted(graph)
+        self.node2direct_predecessors = [
+            frozenset(core.predecessors(node)) for node in self.nodes
+        ]
+        self.node2direct_successors = [
+            frozenset(core.successors(node)) for node in self.nodes
+        ]
         self.node2predecessors = _reachability(self.node2direct_predecessors)
         self.node2successors = _reachability(self.node2direct_successors)
 
 
 def marginal_cost(
-    graph: _Graph[HashableT],
-    before: Sequence[HashableT],
-    this: HashableT,
-    after: FrozenSet[HashableT],
+    graph: _Graph,
+    before: Sequence[int],
+    this: int,
+    after: FrozenSet[int],
 ) -> int:
     # Count the number of edges passing overhead that get longer as a result of
-    # placing this node here
-    extending = set(before)
-    extensions = [
-        len(graph.node2direct_predecessors[right] & extending) for right in after
-    ]
+    # placing this node here. Since `before`, `this` and `after` together are all the
+    # nodes these are the edges into `after` that do not start at this node.
+    extensions = _num_entering(graph, after) - len(
+        graph.node2direct_successors[this] & after
+    )
 
     # Count the number of edges that cross other edges as a result of placing this
     # node here. Ignore multiple edges that use the same crossing since more edges
     # using the same crossing is more chaotic than a single edge using that crossing.
-    node2position = {v: i for i, v in enumerate(before)}
     dpreds = graph.node2direct_predecessors[this]
-    dpred_positions = [
-        node2position[direct_predecessor] for direct_predecessor in dpreds
-    ]
-    first_dpred_pos = min(dpred_positions, default=len(before))
+    first_dpred_pos = min(map(before.index, dpreds), default=len(before))
     interacting = set(before[first_dpred_pos:]) - dpreds
-    preds_on_left_of_node_on_right: Set[HashableT] = functools.reduce(
-        operator.or_, [graph.node2direct_predecessors[right] for right in after], set()
-    )
-    interactions = preds_on_left_of_node_on_right & interacting
+    # Nodes that are direct predecessors of some node on the right
+    interactions = [
+        node
+        for node in interacting
+        if not graph.node2direct_successors[node].isdisjoint(after)
+    ]
 
-    return sum(extensions) + len(interactions)
+    return extensions + len(interactions)
+
+
+@functools.lru_cache(maxsize=100_000)
+def _num_entering(graph: _Graph, nodes: FrozenSet[int]) -> int:
+    """Return the number of edges from other nodes to `nodes`"""
+    return sum(len(graph.node2direct_predecessors[node] - nodes) for node in nodes)
 
 
 @functools.lru_cache(maxsize=100_000)
 def cost(
-    graph: _Graph[HashableT],
-    prefix: Sequence[HashableT],
-    unvisited: FrozenSet[HashableT],
+    graph: _Graph,
+    prefix: Sequence[int],
+    unvisited: FrozenSet[int],
 ) -> int:
     """Returns a number quantifying how not nice the graph would look when drawn
 
@@ -130,16 +124,26 @@ def cost(
 
 
 def _topological_orderings(
-    g,
-    path: Tuple[HashableT, ...],
-    should_be_pruned: Callable[[Tuple[HashableT, ...], FrozenSet[HashableT]], bool],
-) -> Iterator[Tuple[HashableT, ...]]:
-    """Yield topological orderings of graph"""
+    g: _Graph,
+    path: Tuple[int, ...],
+    should_be_pruned: Callable[[Tuple[int, ...], FrozenSet[int]], bool],
+    nodes: Optional[Sequence[int]] = None,
+    should_pause: Optional[Callable[[], bool]] = None,
+) -> Iterator[Optional[Tuple[int, ...]]]:
+    """Yield topological orderings of graph
+
+    If `nodes` is given then only `path` followed by orderings of those is yielded.
+    If `should_pause` returns true after a branch is expanded then None is yielded,
+    giving the caller a chance to do other work.
+    """
     visited = set(path)
-    for node in g.nodes:
-        if node in visited:
-            continue
-
+    candidates = g.nodes if nodes is None else nodes
+    remaining = [node for node in candidates if node not in visited]
+    if not remaining:
+        # Only happens for graphs without nodes, which have one ordering
+        yield path
+        return
+    for node in remaining:
         # Prune branches that would not be ordered
         if g.node2predecessors[node] - visited:
             continue
@@ -150,35 +154,508 @@ def _topological_orderings(
         if should_be_pruned(new_path, new_unvisited):
             continue
 
-        if new_unvisited:
-            yield from _topological_orderings(g, new_path, should_be_pruned)
+        if should_pause is not None and should_pause():
+            yield None
+
+        if len(remaining) > 1:
+            yield from _topological_orderings(
+                g, new_path, should_be_pruned, remaining, should_pause
+            )
         else:
             yield new_path
 
 
-def sorted_topological(digraph: nx.DiGraph) -> Tuple[HashableT, ...]:
+def sorted_topological(
+    digraph: GraphLike, solver: str = "search", time_limit: Optional[float] = None
+) -> Tuple[HashableT, ...]:
     """Return an optimal topological ordering
 
     Not that there may be several others that are equally good.
+
+    `solver` is either "search", for the branch and bound in this module, or "milp",
+    for the mixed integer linear program in `diagv.milp`. If `time_limit` seconds pass
+    before the solver finishes the best ordering found so far is returned.
+
+    Graphs with cycles have no topological ordering. Instead, strongly connected
+    components are ordered by solving the condensation, where every component is a
+    single node, and the nodes within each component are ordered by
+    `_sorted_component`. Neither step is optimal with respect to the whole graph.
+    """
+    core = compiled(digraph)
+    if not core.is_acyclic():
+        return _sorted_cyclic(core, solver, time_limit)
+    if solver == "milp":
+        from diagv import milp
+
+        return milp.solve(core, time_limit).ordering
+    if solver != "search":
+        raise ValueError(f"Unknown solver {solver!r}")
+
+    incumbent = None
+    deadline = None
+    if time_limit is not None:
+        incumbent = [core.nodes[node] for node in core.topological_order()]
+        deadline = time.monotonic() + time_limit
+    return min(as_found(core, incumbent, deadline), key=operator.itemgetter(0))[1]
+
+
+def _sorted_cyclic(
+    core: IndexedGraph[HashableT], solver: str, time_limit: Optional[float]
+) -> Tuple[HashableT, ...]:
+    """Return ordering of a graph with cycles by way of its condensation"""
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    components = core.strongly_connected_components()[::-1]
+    node2component = [0] * len(core)
+    for i, component in enumerate(components):
+        for node in component:
+            node2component[node] = i
+    condensation = IndexedGraph.from_predecessor_lists(
+        range(len(components)),
+        (
+            [
+                node2component[pred]
+                for node in component
+                for pred in core.predecessors(node)
+                if node2component[pred] != i
+            ]
+            for i, component in enumerate(components)
+        ),
+    )
+    component_ordering: Tuple[int, ...] = sorted_topological(
+        condensation,
+        solver,
+        None if deadline is None else max(0.0, deadline - time.monotonic()),
+    )
+    return tuple(
+        core.nodes[node]
+        for i in component_ordering
+        for node in _sorted_component(core, components[i], deadline=deadline)
+    )
+
+
+def _sorted_component(
+    core: IndexedGraph,
+    component: Sequence[int],
+    max_passes: int = 10,
+    deadline: Optional[float] = None,
+) -> List[int]:
+    """Return good ordering of nodes in a strongly connected component
+
+    Fewer edges pointing backwards is better and, among those, shorter edges. Edges to
+    nodes outside the component are ignored. The ordering is found by moving one node
+    at a time to its best position for at most `max_passes` passes over all nodes, or
+    until `deadline` passes, so the time it takes is polynomial in the size of the
+    component.
+    """
+    members = set(component)
+    # Neighbours of each node and whether the edge points away from the node
+    node2edges: Dict[int, List[Tuple[int, bool]]] = {node: [] for node in component}
+    for node in component:
+        for pred in core.predecessors(node):
+            if pred in members and pred != node:
+                node2edges[pred].append((node, True))
+                node2edges[node].append((pred, False))
+
+    order = list(component)
+    for _ in range(max_passes):
+        improved = False
+        for node in component:
+            if deadline is not None and deadline < time.monotonic():
+                return order
+            position = {other: i for i, other in enumerate(order)}
+            old = position[node]
+            best_delta, best_position = (0, 0), old
+            for step in (-1, 1):
+                delta = (0, 0)
+                for new in range(old + step, -1 if step < 0 else len(order), step):
+                    step_delta = _swap_delta(
+                        node2edges, position, node, order[new], step
+                    )
+                    delta = (delta[0] + step_delta[0], delta[1] + step_delta[1])
+                    if delta < best_delta:
+                        best_delta, best_position = delta, new
+            if best_position != old:
+                order.insert(best_position, order.pop(old))
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def _swap_delta(
+    node2edges: Dict[int, List[Tuple[int, bool]]],
+    position: Dict[int, int],
+    node: int,
+    other: int,
+    step: int,
+) -> Tuple[int, int]:
+    """Return change in backwards edges and span when `node` moves past `other`
+
+    `node` moves one step in the direction of `step`, after having moved past all
+    nodes between its original `position` and that of `other`.
     """
-    misc.raise_for_cyclic(digraph)
-    return min(as_found(digraph), key=operator.itemgetter(0))[1]
+    backwards = span = 0
+    passed = position[other]
+    for neighbour, outgoing in node2edges[node]:
+        if neighbour == other:
+            # Moving after a successor or before a predecessor turns the edge back
+            backwards += 1 if outgoing == (step > 0) else -1
+        elif (position[neighbour] - passed) * step > 0:
+            span -= 1
+        else:
+            span += 1
+    for neighbour, _ in node2edges[other]:
+        if neighbour == node:
+            continue
+        if (passed - position[neighbour]) * step > 0:
+            span -= 1
+        else:
+            span += 1
+    return backwards, span
 
 
-def as_found(digraph: nx.DiGraph) -> Iterator[Tuple[int, Tuple[HashableT, ...]]]:
+def as_found(
+    digraph: GraphLike,
+    incumbent: Optional[Sequence[HashableT]] = None,
+    deadline: Optional[float] = None,
+) -> Iterator[Tuple[int, Tuple[HashableT, ...]]]:
     """Return good topological orderings as they are found
 
-    Each ordering is no worse than the previous.
+    Each ordering is no worse than the previous. If `incumbent` is given it is yielded
+    first and used to prune the search from the start. If `deadline`, a value of
+    `time.monotonic`, passes then the search stops early.
     """
-    misc.raise_for_cyclic(digraph)
-    g = _Graph(digraph.pred)
+    for found in _as_found(digraph, incumbent, deadline):
+        if found is not None:
+            yield found
+
+
+def _as_found(
+    digraph: GraphLike,
+    incumbent: Optional[Sequence[HashableT]] = None,
+    deadline: Optional[float] = None,
+    pause_every: Optional[int] = None,
+) -> Iterator[Optional[Tuple[int, Tuple[HashableT, ...]]]]:
+    """Like `as_found` but also yield None after every `pause_every` expansions"""
+    core = compiled(digraph)
+    misc.raise_for_cyclic(core)
+    g = _Graph(core)
     prev_best = math.inf
 
+    if incumbent is not None:
+        prev_best = _primed_cost(g, _validated(core, incumbent))
+        yield prev_best, tuple(incumbent)
+
     def prune(new_path, new_unvisited):
+        if deadline is not None and deadline < time.monotonic():
+            raise _DeadlineExceeded
         return prev_best < cost(g, new_path, new_unvisited)
 
-    for order in _topological_orderings(g, (), prune):
-        curr_best = cost(g, order, frozenset())
-        yield curr_best, order
-        assert curr_best <= prev_best
-        prev_best = curr_best
+    expansions = itertools.count(1)
+
+    def should_pause():
+        return not next(expansions) % pause_every
+
+    try:
+        for order in _topological_orderings(
+            g, (), prune, None, None if pause_every is None else should_pause
+        ):
+            if order is None:
+                yield None
+                continue
+            curr_best = cost(g, order, frozenset())
+            yield curr_best, tuple(core.nodes[node] for node in order)
+            assert curr_best <= prev_best
+            prev_best = curr_best
+    except _DeadlineExceeded:
+        return
+
+
+def k_best_orderings(
+    digraph: GraphLike, k: int, distinct: bool = False
+) -> List[Tuple[int, Tuple[HashableT, ...]]]:
+    """Return the `k` best topological orderings and their costs, best first
+
+    All are found in a single search that prunes branches no better than the `k`-th
+    best ordering so far, so ties with it may be left out. Fewer than `k` orderings are
+    returned if the graph does not have that many.
+
+    If `distinct` is true then orderings that only differ by swapping interchangeable
+    nodes, nodes with the same direct predecessors and successors, count as one.
+    """
+    if k < 1:
+        raise ValueError(f"Expected k to be positive but got {k}")
+    core = compiled(digraph)
+    misc.raise_for_cyclic(core)
+    g = _Graph(core)
+    node2earlier_twins = _earlier_twins(g) if distinct else [()] * len(g.nodes)
+
+    # The worst of the best orderings so far is first since costs are negated
+    best: List[Tuple[int, int, Tuple[int, ...]]] = []
+
+    def prune(new_path, new_unvisited):
+        if any(twin in new_unvisited for twin in node2earlier_twins[new_path[-1]]):
+            return True
+        return len(best) == k and -best[0][0] <= cost(g, new_path, new_unvisited)
+
+    for i, order in enumerate(_topological_orderings(g, (), prune)):
+        assert order is not None
+        item = (-cost(g, order, frozenset()), -i, order)
+        if len(best) < k:
+            heapq.heappush(best, item)
+        else:
+            heapq.heapreplace(best, item)
+    return [
+        (-negated_cost, tuple(core.nodes[node] for node in order))
+        for negated_cost, _, order in sorted(best, reverse=True)
+    ]
+
+
+def _earlier_twins(g: _Graph) -> List[Tuple[int, ...]]:
+    """Return list mapping each node to the interchangeable nodes with lower ids"""
+    neighbourhood2nodes: Dict[Tuple[FrozenSet[int], FrozenSet[int]], List[int]] = (
+        collections.defaultdict(list)
+    )
+    result: List[Tuple[int, ...]] = []
+    for node in g.nodes:
+        twins = neighbourhood2nodes[
+            g.node2direct_predecessors[node], g.node2direct_successors[node]
+        ]
+        result.append(tuple(twins))
+        twins.append(node)
+    return result
+
+
+class _DeadlineExceeded(Exception):
+    """Raised to abandon a search that has run out of time"""
+
+
+def _validated(core: IndexedGraph, ordering: Sequence[HashableT]) -> Tuple[int, ...]:
+    """Return `ordering` as node ids after checking that it is topological"""
+    order = tuple(core.node2id[node] for node in ordering)
+    if sorted(order) != list(range(len(core))):
+        raise ValueError("Ordering must contain every node exactly once")
+    position = {node: i for i, node in enumerate(order)}
+    if any(
+        position[pred] > position[node]
+        for node in order
+        for pred in core.predecessors(node)
+    ):
+        raise ValueError("Ordering must be topological")
+    return order
+
+
+def reoptimize(
+    digraph: GraphLike,
+    previous_ordering: Sequence[HashableT],
+    previous_digraph: Optional[GraphLike] = None,
+    deadline: Optional[float] = None,
+    exhaustive: bool = False,
+    window: int = 6,
+) -> Tuple[HashableT, ...]:
+    """Return a good topological ordering given one for a similar graph
+
+    The previous ordering is first repaired; nodes that no longer exist are dropped,
+    new nodes are placed after their predecessors and edges that now point backwards
+    are fixed. If no nodes are affected the repaired ordering is returned as is.
+    Otherwise windows of `window` consecutive nodes, overlapping by half, are
+    reordered optimally one at a time, starting with the windows covering the
+    affected nodes. Whenever a window is improved the windows overlapping it are
+    reordered again. Each window takes at most `window` factorial steps, so the time
+    it takes grows with the number of improvements rather than exponentially with the
+    size of the graph.
+
+    The result is not necessarily optimal since only nodes within the same window are
+    ever swapped. With `exhaustive` the whole graph is searched afterwards, making the
+    result optimal but taking about as long as solving from scratch. Either way the
+    search stops early if the ordering is no worse than `_lower_bound`, or when
+    `deadline` passes.
+
+    Affected nodes are the new nodes, the nodes next to removed nodes in the previous
+    ordering, the endpoints of edges that the previous ordering violates and, if
+    `previous_digraph` is given, the endpoints of all edges that were added or
+    removed.
+    """
+    core = compiled(digraph)
+    misc.raise_for_cyclic(core)
+    g = _Graph(core)
+    order = _repaired(core, previous_ordering)
+    affected = _affected(core, previous_ordering, previous_digraph)
+    if not (affected or exhaustive):
+        return tuple(core.nodes[node] for node in order)
+
+    best = _primed_cost(g, order)
+    lower_bound = _lower_bound(g)
+    positions = [i for i, node in enumerate(order) if node in affected]
+    lo, hi = (positions[0], positions[-1]) if positions else (0, len(order) - 1)
+
+    # Cost of the nodes after the window that does not depend on the order within it
+    offset = 0
+
+    def prune(new_path, new_unvisited):
+        if deadline is not None and deadline < time.monotonic():
+            raise _DeadlineExceeded
+        return best <= offset + cost(g, new_path, new_unvisited)
+
+    def improve(start, stop):
+        """Reorder the nodes from `start` up to `stop` and return if that helped"""
+        nonlocal order, best, offset
+        prefix, inside, suffix = order[:start], order[start:stop], order[stop:]
+        _primed_cost(g, prefix)
+        after_window = frozenset(suffix)
+        # Only the crossings of nodes whose first direct predecessor is in the window
+        # depend on the order within it, so only these are recomputed per candidate
+        dependent = [
+            (k, frozenset(suffix[k + 1 :]))
+            for k, node in enumerate(suffix)
+            if g.node2direct_predecessors[node].intersection(inside)
+            and not g.node2direct_predecessors[node].intersection(prefix)
+        ]
+
+        def dependent_cost(path):
+            ordering = path + suffix
+            return sum(
+                marginal_cost(g, ordering[: stop + k], suffix[k], after)
+                for k, after in dependent
+            )
+
+        offset = (
+            best - _primed_cost(g, order[:stop], start) - dependent_cost(order[:stop])
+        )
+        improved = False
+        for path in _topological_orderings(g, prefix, prune, inside):
+            assert path is not None
+            candidate_cost = offset + cost(g, path, after_window) + dependent_cost(path)
+            if candidate_cost < best:
+                order, best, improved = path + suffix, candidate_cost, True
+        offset = 0
+        return improved
+
+    step = max(1, window // 2)
+    last_start = max(0, len(order) - window)
+    pending = collections.deque(_window_starts(lo, hi, window, step, len(order)))
+    try:
+        while pending and lower_bound < best:
+            start = pending.popleft()
+            if improve(start, min(len(order), start + window)):
+                # The windows overlapping this one may now be improved too
+                for neighbour in (max(0, start - step), min(last_start, start + step)):
+                    if neighbour != start and neighbour not in pending:
+                        pending.append(neighbour)
+        if exhaustive and lower_bound < best:
+            improve(0, len(order))
+    except _DeadlineExceeded:
+        pass
+    return tuple(core.nodes[node] for node in order)
+
+
+def _window_starts(lo: int, hi: int, size: int, step: int, length: int) -> List[int]:
+    """Return starts of windows of `size` that together cover `lo`..`hi`
+
+    Consecutive windows start `step` apart and all of them are within `length`.
+
+    >>> _window_starts(5, 6, 4, 2, 10)
+    [4]
+    >>> _window_starts(2, 9, 4, 2, 10)
+    [2, 4, 6]
+    """
+    slack = max(0, size - (hi - lo + 1))
+    first = max(0, min(lo - slack // 2, length - size))
+    last = max(first, min(hi - size + 1, length - size))
+    return list(range(first, last, step)) + [last]
+
+
+def _lower_bound(g: _Graph) -> int:
+    """Return a number that no ordering of `g` has a lower cost than
+
+    The edges into a node must start at distinct positions before it, so the nodes
+    passed by these edges number at least 0 + 1 + ... + (indegree - 1). The same goes
+    for edges out of a node. Crossings are not counted.
+    """
+    return max(
+        sum(len(dpreds) * (len(dpreds) - 1) // 2 for dpreds in neighbours)
+        for neighbours in (g.node2direct_predecessors, g.node2direct_successors)
+    )
+
+
+def _primed_cost(g: _Graph, ordering: Tuple[int, ...], start: int = 0) -> int:
+    """Return cost of `ordering` without deep recursion
+
+    The cost of every prefix longer than `start`, and of the whole ordering, is
+    computed, shortest first, so that each call finds the cost of the prefix before it
+    cached. This also speeds up any later call on a path starting with these prefixes.
+    """
+    result = 0
+    for stop in range(min(start + 1, len(ordering)), len(ordering) + 1):
+        prefix = ordering[:stop]
+        result = cost(g, prefix, g.nodes_set.difference(prefix))
+    return result
+
+
+def _repaired(core: IndexedGraph, ordering: Sequence[HashableT]) -> Tuple[int, ...]:
+    """Return topological ordering of `core` that stays close to `ordering`"""
+    node2position = {node: i for i, node in enumerate(ordering)}
+    priorities = [0.0] * len(core)
+    for node in core.topological_order():
+        label = core.nodes[node]
+        if label in node2position:
+            priorities[node] = node2position[label]
+        else:
+            priorities[node] = (
+                max((priorities[pred] for pred in core.predecessors(node)), default=-1)
+                + 0.5
+            )
+
+    in_degrees = [len(core.predecessors(node)) for node in range(len(core))]
+    ready = [(priorities[node], node) for node, d in enumerate(in_degrees) if not d]
+    heapq.heapify(ready)
+    result = []
+    while ready:
+        _, node = heapq.heappop(ready)
+        result.append(node)
+        for succ in core.successors(node):
+            in_degrees[succ] -= 1
+            if not in_degrees[succ]:
+                heapq.heappush(ready, (priorities[succ], succ))
+    return tuple(result)
+
+
+def _affected(
+    core: IndexedGraph,
+    previous_ordering: Sequence[HashableT],
+    previous_digraph: Optional[GraphLike],
+) -> Set[int]:
+    """Return nodes in `core` whose placement may need to change"""
+    node2position = {node: i for i, node in enumerate(previous_ordering)}
+    result = {i for i, node in enumerate(core.nodes) if node not in node2position}
+    previous: Optional[int] = None
+    after_removed = False
+    for label in previous_ordering:
+        if label not in core.node2id:
+            if previous is not None:
+                result.add(previous)
+            after_removed = True
+            continue
+        previous = core.node2id[label]
+        if after_removed:
+            result.add(previous)
+            after_removed = False
+    for node in range(len(core)):
+        for pred in core.predecessors(node):
+            if node in result or pred in result:
+                continue
+            if node2position[core.nodes[node]] < node2position[core.nodes[pred]]:
+                result.update([node, pred])
+
+    if previous_digraph is not None:
+        for edge in _edges(compiled(previous_digraph)) ^ _edges(core):
+            result.update(core.node2id[node] for node in edge if node in core.node2id)
+    return result
+
+
+def _edges(core: IndexedGraph[HashableT]) -> Set[Tuple[HashableT, HashableT]]:
+    return {
+        (core.nodes[pred], core.nodes[node])
+        for node in range(len(core))
+        for pred in core.predecessors(node)
+    }
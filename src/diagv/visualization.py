@@ -4,50 +4,37 @@ from __future__ import annotations
 
 import dataclasses
 import itertools
-from typing import Callable, Generic, Iterable, Iterator, Optional, Sequence, Union
-
-import more_itertools
-import networkx as nx
-
-from diagv.typing_utils import AdjacencyListT, HashableT, NormalizedAdjacencyList
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from diagv.core import GraphLike, IndexedGraph, compiled
+from diagv.typing_utils import HashableT
 
 
 def text_art(
-    digraph: nx.DiGraph,
+    digraph: GraphLike,
     ordering: Optional[Sequence[HashableT]] = None,
     fmt: Callable[[HashableT], str] = str,
 ) -> str:
-    try:
-        nx.find_cycle(digraph)
-    except nx.NetworkXNoCycle:
-        pass
-    else:
-        NotImplementedError("Only DAGs are supported so far")
-
+    graph = compiled(digraph)
     if ordering is None:
-        ordering = list(nx.topological_sort(digraph))
+        ordering = [graph.nodes[node] for node in graph.topological_order()]
 
     col2width = {i: len(fmt(v)) for i, v in enumerate(ordering)}
-    cells = _cells(digraph, ordering)
+    cells = _cells(graph, ordering)
     return "".join(_fmt_cells(cells, col2width, fmt))
 
 
-def _nodes(graph: AdjacencyListT[HashableT]) -> Iterator[HashableT]:
-    """Yield nodes in graph in reproducible order"""
-    return more_itertools.unique_everseen(itertools.chain(graph, *graph.values()))
-
-
-def _inverted(
-    graph: AdjacencyListT[HashableT],
-) -> NormalizedAdjacencyList[HashableT]:
-    """Return graph with all arrows reverted"""
-    result: NormalizedAdjacencyList[HashableT] = {node: set() for node in _nodes(graph)}
-    for node in result:
-        for adjacent in graph.get(node, []):
-            result[adjacent].add(node)
-    return result
-
-
 class Token(str):
     ...
 
@@ -68,14 +55,17 @@ class Cell(Generic[HashableT]):
 
 
 def _cells(
-    digraph: nx.DiGraph, order: Sequence[HashableT]
+    graph: IndexedGraph[HashableT], order: Sequence[HashableT]
 ) -> Iterator[Optional[Cell[HashableT]]]:
-    node2position = {v: i for i, v in enumerate(order)}
+    id2position = {graph.node2id[v]: i for i, v in enumerate(order)}
     dpred_lists = {
-        node2position[node]: [node2position[dpred] for dpred in dpreds]
-        for node, dpreds in digraph.pred.items()
+        position: [id2position[dpred] for dpred in graph.predecessors(node)]
+        for node, position in id2position.items()
+    }
+    dsucc_lists = {
+        position: {id2position[dsucc] for dsucc in graph.successors(node)}
+        for node, position in id2position.items()
     }
-    dsucc_lists = _inverted(dpred_lists)
 
     for row, row_node in enumerate(order):
         if row:
@@ -246,3 +236,133 @@ def _fmt_subcell(subcell: Union[HashableT, Token], width, fmt):
         return subcell
     else:
         return f"{fmt(subcell)[:width]:.^{width}}"
+
+
+@dataclasses.dataclass(frozen=True)
+class Group(Generic[HashableT]):
+    """One or more nodes drawn as a single entry on the diagonal"""
+
+    members: Tuple[HashableT, ...]
+
+    def label(self, fmt: Callable[[HashableT], str] = str) -> str:
+        if len(self.members) == 1:
+            return fmt(self.members[0])
+        first = fmt(self.members[0])
+        last = fmt(self.members[-1])
+        return f"{first}..{last}({len(self.members)})"
+
+
+def condensed(
+    digraph: GraphLike,
+    clusters: Iterable[Iterable[HashableT]] = (),
+    expand: Iterable[HashableT] = (),
+) -> Dict[Group[HashableT], List[Group[HashableT]]]:
+    """Return graph with clusters and maximal linear chains collapsed into groups
+
+    The result maps every group to its direct successors and the members of all
+    groups together are exactly the nodes of `digraph`. Any group containing a node
+    in `expand` is replaced by one singleton group per member.
+
+    Raises `ValueError` if collapsing the clusters of an acyclic graph would make it
+    cyclic, as happens when a path leaves a cluster and then returns to it.
+    """
+    graph = compiled(digraph)
+    id2group = _id2group(graph, clusters)
+    to_expand = set()
+    for expanded_node in expand:
+        if expanded_node not in graph.node2id:
+            raise ValueError(f"Node {expanded_node!r} is not in graph")
+        to_expand.add(graph.node2id[expanded_node])
+    for node, group in enumerate(id2group):
+        if len(group.members) > 1 and to_expand.intersection(
+            graph.node2id[member] for member in group.members
+        ):
+            id2group[node] = Group((graph.nodes[node],))
+
+    result: Dict[Group[HashableT], List[Group[HashableT]]] = {}
+    for node, group in enumerate(id2group):
+        successors = result.setdefault(group, [])
+        for successor in graph.successors(node):
+            if id2group[successor] != group:
+                successors.append(id2group[successor])
+    result = {group: list(dict.fromkeys(succs)) for group, succs in result.items()}
+    if not compiled(result).is_acyclic() and graph.is_acyclic():
+        raise ValueError("Collapsing the clusters would create a cycle")
+    return result
+
+
+def expanded(ordering: Iterable[Group[HashableT]]) -> List[HashableT]:
+    """Return ordering of the original nodes from an ordering of groups"""
+    return [member for group in ordering for member in group.members]
+
+
+def condensed_text_art(
+    digraph: GraphLike,
+    ordering: Optional[Sequence[HashableT]] = None,
+    fmt: Callable[[HashableT], str] = str,
+    clusters: Iterable[Iterable[HashableT]] = (),
+    expand: Iterable[HashableT] = (),
+) -> str:
+    """Like `text_art` but with clusters and linear chains drawn as single nodes
+
+    `ordering` is an ordering of the nodes in `digraph`; each group is placed where
+    its first member appears.
+    """
+    reduced = condensed(digraph, clusters, expand)
+    group_ordering = None
+    if ordering is not None:
+        node2group = {member: group for group in reduced for member in group.members}
+        group_ordering = list(dict.fromkeys(node2group[node] for node in ordering))
+    return text_art(reduced, group_ordering, lambda group: group.label(fmt))
+
+
+def _id2group(
+    graph: IndexedGraph[HashableT], clusters: Iterable[Iterable[HashableT]]
+) -> List[Group[HashableT]]:
+    """Return list mapping each node id to the group it is collapsed into"""
+    id2group: List[Optional[Group[HashableT]]] = [None] * len(graph)
+    for cluster in clusters:
+        group = Group(tuple(cluster))
+        for clustered in group.members:
+            if clustered not in graph.node2id:
+                raise ValueError(f"Node {clustered!r} is not in graph")
+            if id2group[graph.node2id[clustered]] is not None:
+                raise ValueError(f"Node {clustered!r} is in more than one cluster")
+            id2group[graph.node2id[clustered]] = group
+
+    def chains_to(head, tail):
+        return (
+            id2group[head] is None
+            and id2group[tail] is None
+            and head != tail
+            and len(graph.successors(head)) == 1
+            and len(graph.predecessors(tail)) == 1
+        )
+
+    def chain_successor(head):
+        successors = graph.successors(head)
+        if successors and chains_to(head, successors[0]):
+            return successors[0]
+        return None
+
+    def chain_predecessor(tail):
+        predecessors = graph.predecessors(tail)
+        if predecessors and chains_to(predecessors[0], tail):
+            return predecessors[0]
+        return None
+
+    for node in range(len(graph)):
+        if id2group[node] is not None or chain_predecessor(node) is not None:
+            continue
+        members = [node]
+        while (successor := chain_successor(members[-1])) is not None:
+            members.append(successor)
+        group = Group(tuple(graph.nodes[member] for member in members))
+        for member in members:
+            id2group[member] = group
+
+    # Remaining nodes form rings where every node continues a chain
+    return [
+        Group((graph.nodes[node],)) if group is None else group
+        for node, group in enumerate(id2group)
+    ]
@@ -1,8 +1,28 @@
+import asyncio
+import concurrent.futures
+import io
+import json
+import math
+import random
+import re
+import subprocess
+import sys
 import textwrap
+import time
 
 import pytest
 
-from diagv import generators, misc, optimization, visualization
+from diagv import (
+    aio,
+    binary,
+    cache,
+    cli,
+    core,
+    generators,
+    misc,
+    optimization,
+    visualization,
+)
 
 
 def foo():
@@ -236,3 +256,625 @@ def test_drawing_by_example(graph, ordering, fmt, expected):
 def test_optimization_by_example(graph, expected):
     # Output does not need to look exactly as in these examples
     assert list(optimization.sorted_topological(graph)) == list(expected)
+
+
+@pytest.mark.parametrize(
+    "graph, ordering, clusters, expand, expected",
+    [
+        (
+            generators.diline(6),
+            None,
+            [],
+            [],
+            """
+            0..5(6)
+            """,
+        ),
+        (
+            generators.dibull(),
+            [0, 1, 2, 3, 4],
+            [],
+            [],
+            """
+            0..1(2)-+---+
+                    +-2-+
+                        +-3..4(2)
+            """,
+        ),
+        (
+            generators.dibull(),
+            [0, 1, 2, 3, 4],
+            [],
+            [4],
+            """
+            0..1(2)-+---+
+                    +-2-+
+                        +-3-+
+                            +-4
+            """,
+        ),
+        (
+            generators.a_ring(),
+            "DFEIHCGAB",
+            ["DF"],
+            [],
+            """
+            D..F(2)-+
+                    +-E..I(2)-+---+
+                    |         +-H |
+                    +-------------+-C..A(3)-+
+                                            +-B
+            """,
+        ),
+    ],
+)
+def test_condensed_drawing_by_example(graph, ordering, clusters, expand, expected):
+    expected = textwrap.dedent(expected)[1:-1]
+    actual = visualization.condensed_text_art(
+        graph, ordering=ordering, clusters=clusters, expand=expand
+    )
+    assert actual == expected
+
+
+def test_condensed_groups_partition_nodes():
+    graph = generators.ditutte_fragment()
+    reduced = visualization.condensed(graph, clusters=["DGH"])
+    assert sorted(visualization.expanded(reduced)) == sorted(graph)
+    assert visualization.Group(("D", "G", "H")) in reduced
+
+
+@pytest.mark.parametrize(
+    "graph, clusters, expand",
+    [
+        (generators.diline(4), [[0, 2]], []),
+        (misc.digraph({"a": ["b"], "c": ["d"], "b": ["x"], "x": ["c"]}), [], ["y"]),
+        (misc.digraph({"a": ["b"], "c": ["d"]}), [["a", "d"], ["b", "c"]], []),
+        (misc.digraph({"a": ["b"]}), [["a", "c"]], []),
+    ],
+)
+def test_condensed_rejects_invalid_groups(graph, clusters, expand):
+    with pytest.raises(ValueError):
+        visualization.condensed_text_art(graph, clusters=clusters, expand=expand)
+
+
+def test_compiled_graph_can_be_reused():
+    adjacency = {"D": "A", "I": "AG", "A": "V", "G": "V"}
+    graph = core.compiled(adjacency)
+    ordering = optimization.sorted_topological(graph)
+    assert ordering == optimization.sorted_topological(misc.digraph(adjacency))
+    assert visualization.text_art(graph, ordering) == visualization.text_art(
+        misc.digraph(adjacency), ordering
+    )
+
+
+def test_import_is_fast_and_does_not_import_networkx():
+    code = (
+        "import json, sys, time;"
+        "start = time.perf_counter();"
+        "import diagv.optimization, diagv.visualization;"
+        "print(json.dumps([time.perf_counter() - start, 'networkx' in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, check=True, text=True
+    ).stdout
+    duration, imports_networkx = json.loads(output)
+    assert not imports_networkx
+    assert duration < 0.5
+
+
+def test_adjacency_mapping_is_enough():
+    adjacency = {"D": "AI", "I": "A", "A": "GV", "G": "V"}
+    ordering = optimization.sorted_topological(adjacency)
+    assert ordering == tuple("DIAGV")
+    assert visualization.text_art(adjacency, ordering) == textwrap.dedent(
+        """
+        D-+---+
+          +-I-+
+              +-A-+---+
+                  +-G-+
+                      +-V
+        """
+    )[1:-1]
+
+
+def _cost(graph, ordering):
+    return next(optimization.as_found(graph, incumbent=ordering))[0]
+
+
+def test_cache_reuses_ordering_for_relabeled_graph(tmp_path):
+    graph = generators.ditutte_fragment()
+    relabeled = misc.digraph(
+        {
+            head.lower(): [tail.lower() for tail in tails]
+            for head, tails in graph.succ.items()
+        }
+    )
+    with cache.OrderingCache(tmp_path) as orderings:
+        expected = orderings.sorted_topological(graph)
+        assert orderings.get(graph) == cache.CachedOrdering(
+            expected, _cost(graph, expected), True
+        )
+        actual = orderings.get(relabeled)
+    assert actual is not None
+    assert actual.ordering == tuple(node.lower() for node in expected)
+    assert _cost(relabeled, actual.ordering) == _cost(graph, expected)
+
+
+@pytest.mark.parametrize(
+    "graph",
+    [
+        {"a": ["c"], "b": ["d"], "c": [], "d": []},
+        {
+            head: list(tails)
+            for head, tails in generators.ditutte_fragment().succ.items()
+        },
+        {head: list(tails) for head, tails in generators.distar(5).succ.items()},
+    ],
+)
+def test_cache_does_not_depend_on_insertion_order(graph, tmp_path):
+    rng = random.Random(0)
+    with cache.OrderingCache(tmp_path) as orderings:
+        expected = _cost(graph, orderings.sorted_topological(graph))
+        for _ in range(5):
+            nodes = list(graph)
+            rng.shuffle(nodes)
+            shuffled = {
+                node: rng.sample(graph[node], len(graph[node])) for node in nodes
+            }
+            actual = orderings.get(shuffled)
+            assert actual is not None
+            assert _cost(shuffled, actual.ordering) == expected
+
+
+def test_cache_resumes_partial_result(tmp_path):
+    graph = generators.ditutte_fragment()
+    with cache.OrderingCache(tmp_path) as orderings:
+        orderings.put(graph, "ABCDEFGHIJKLMNOPQ", 1000, complete=False)
+        ordering = orderings.sorted_topological(graph)
+        assert ordering == tuple("ACBEDGHMIFJNKLOQP")
+        assert orderings.get(graph).complete
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    graphs = [generators.diline(n) for n in range(2, 6)]
+    with cache.OrderingCache(tmp_path, max_bytes=200) as orderings:
+        for graph in graphs:
+            orderings.sorted_topological(graph)
+        assert orderings.get(graphs[0]) is None
+        assert orderings.get(graphs[-1]) is not None
+
+
+def _with_edges(graph, edges):
+    result = graph.copy()
+    result.add_edges_from(edges)
+    return result
+
+
+def _without_nodes(graph, nodes):
+    result = graph.copy()
+    result.remove_nodes_from(nodes)
+    return result
+
+
+@pytest.mark.parametrize(
+    "previous_graph, graph",
+    [
+        (
+            generators.ditutte_fragment(),
+            _with_edges(generators.ditutte_fragment(), [("Q", "P"), ("P", "R")]),
+        ),
+        (
+            generators.ditutte_fragment(),
+            _without_nodes(generators.ditutte_fragment(), "M"),
+        ),
+        (
+            generators.diagv_butterfly_acyclic(),
+            _with_edges(generators.diagv_butterfly_acyclic(), [("I", "V")]),
+        ),
+    ],
+)
+def test_reoptimize_is_as_good_as_solving_from_scratch(previous_graph, graph):
+    previous_ordering = optimization.sorted_topological(previous_graph)
+    expected = optimization.sorted_topological(graph)
+    for previous in (previous_graph, None):
+        actual = optimization.reoptimize(
+            graph, previous_ordering, previous, exhaustive=True
+        )
+        assert _cost(graph, actual) == _cost(graph, expected)
+        local = optimization.reoptimize(graph, previous_ordering, previous)
+        assert _cost(graph, actual) <= _cost(graph, local)
+
+
+def test_reoptimize_returns_unaffected_ordering_at_once():
+    graph = generators.ditutte_fragment()
+    ordering = tuple(sorted(graph))
+    assert optimization.reoptimize(graph, ordering, graph) == ordering
+
+
+def test_reoptimize_is_fast_for_small_edits_to_large_graphs():
+    import networkx as nx
+
+    rng = random.Random(0)
+    previous_graph = nx.DiGraph()
+    previous_graph.add_nodes_from(range(300))
+    previous_graph.add_edges_from(
+        (head, tail)
+        for head in range(300)
+        for tail in range(head + 1, min(300, head + 6))
+        if rng.random() < 0.4
+    )
+    graph = _with_edges(previous_graph, [(100, 107)])
+
+    start = time.monotonic()
+    ordering = optimization.reoptimize(graph, range(300), previous_graph)
+    assert time.monotonic() - start < 5
+    assert _cost(graph, ordering) <= _cost(graph, range(300))
+
+
+def _brute_force_cost(graph):
+    import networkx as nx
+
+    return min(_cost(graph, ordering) for ordering in nx.all_topological_sorts(graph))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_reoptimize_is_optimal_after_random_edits(seed):
+    import networkx as nx
+
+    rng = random.Random(seed)
+    previous_graph = nx.DiGraph()
+    previous_graph.add_nodes_from(range(7))
+    previous_graph.add_edges_from(
+        (head, tail)
+        for head in range(7)
+        for tail in range(head + 1, 7)
+        if rng.random() < 0.3
+    )
+    graph = _with_edges(
+        previous_graph, [(rng.randrange(3), rng.randrange(3, 6)), (1, "new")]
+    )
+    graph.remove_node(rng.randrange(7))
+    previous_ordering = optimization.sorted_topological(previous_graph)
+    for previous in (previous_graph, None):
+        actual = optimization.reoptimize(
+            graph, previous_ordering, previous, exhaustive=True
+        )
+        assert _cost(graph, actual) == _brute_force_cost(graph)
+
+
+@pytest.mark.parametrize(
+    "graph",
+    [
+        generators.dibull(),
+        generators.distar(4),
+        generators.distar(-4),
+        generators.ditutte_fragment(),
+        generators.diagv(),
+        generators.diagv_butterfly_acyclic(),
+        misc.digraph({foo: [foobar], bar: [foobar]}),
+    ],
+)
+def test_milp_agrees_with_search(graph):
+    pytest.importorskip("scipy")
+    from diagv import milp
+
+    solution = milp.solve(graph)
+    expected = optimization.sorted_topological(graph)
+    assert solution.optimal
+    assert solution.cost == _cost(graph, solution.ordering) == _cost(graph, expected)
+    assert _cost(graph, optimization.sorted_topological(graph, "milp")) == _cost(
+        graph, expected
+    )
+
+
+@pytest.mark.parametrize("solver", ["search", "milp"])
+def test_time_limit_still_returns_ordering(solver):
+    if solver == "milp":
+        pytest.importorskip("scipy")
+    graph = generators.ditutte_fragment()
+    ordering = optimization.sorted_topological(graph, solver, time_limit=0.01)
+    assert sorted(ordering) == sorted(graph)
+    assert _cost(graph, ordering) >= 49
+
+
+@pytest.mark.parametrize("solver", ["search", "milp"])
+@pytest.mark.parametrize("time_limit", [None, 0.01])
+def test_wrappers_accept_solver_and_time_limit(solver, time_limit, tmp_path):
+    if solver == "milp":
+        pytest.importorskip("scipy")
+    graph = generators.ditutte_fragment()
+    with cache.OrderingCache(tmp_path) as orderings:
+        cached = orderings.sorted_topological(graph, solver, time_limit)
+    awaited = asyncio.run(aio.sorted_topological(graph, solver, time_limit))
+    for ordering in [cached, awaited]:
+        assert sorted(ordering) == sorted(graph)
+        if time_limit is None:
+            assert _cost(graph, ordering) == 49
+
+
+def test_wrappers_reject_unknown_solver(tmp_path):
+    graph = generators.ditutte_fragment()
+    with cache.OrderingCache(tmp_path) as orderings:
+        with pytest.raises(ValueError):
+            orderings.sorted_topological(graph, "magic")
+    with pytest.raises(ValueError):
+        asyncio.run(aio.sorted_topological(graph, "magic"))
+
+
+def test_cli_draws_graphs_from_files(tmp_path, capsys):
+    (tmp_path / "a.txt").write_text("D A\nI A\nI G\nA V\nG V\n")
+    (tmp_path / "b.json").write_text(
+        json.dumps({"D": "A", "I": "AG", "A": "V", "G": "V"})
+    )
+    (tmp_path / "c.dot").write_text("digraph { D -> A -> V; I -> G -> V; I -> A }")
+    paths = [str(tmp_path / name) for name in ["a.txt", "b.json", "c.dot"]]
+
+    assert cli.main(["--workers", "2", "--format", "json", *paths]) == 0
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert sorted(record["name"] for record in records) == paths
+    graph = generators.diagv()
+    for record in records:
+        assert _cost(graph, record["ordering"]) == _cost(graph, "DIAGV")
+        assert record["text_art"] == visualization.text_art(graph, record["ordering"])
+
+
+def test_cli_reads_json_lines_from_stdin(monkeypatch, capsys):
+    lines = [
+        json.dumps({"name": "bull", "graph": {"0": ["1"], "1": ["2", "3"]}}),
+        json.dumps({"a": ["b"], "b": ["a"]}),
+    ]
+    monkeypatch.setattr(sys, "stdin", io.StringIO("\n".join(lines)))
+
+    assert cli.main(["--workers", "1"]) == 0
+
+    captured = capsys.readouterr()
+    assert captured.out.startswith("# bull\n0-+\n")
+    assert "# <stdin>:2\n+-a-+\n+---+-b\n" in captured.out
+
+
+def test_cli_reports_graphs_that_cannot_be_solved(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "scipy", None)
+    monkeypatch.setattr(sys, "stdin", io.StringIO(json.dumps({"a": ["b"]})))
+
+    assert cli.main(["--workers", "1", "--solver", "milp"]) == 1
+
+    assert capsys.readouterr().err.startswith("<stdin>:1: ModuleNotFoundError")
+
+
+def test_cli_reports_unexpected_errors_per_graph(monkeypatch, capsys):
+    def sorted_topological(graph, solver, time_limit):
+        if "b" in graph:
+            raise MemoryError("too big")
+        return tuple(graph)
+
+    monkeypatch.setattr(optimization, "sorted_topological", sorted_topological)
+    lines = [json.dumps({"b": []}), json.dumps({"a": []})]
+    monkeypatch.setattr(sys, "stdin", io.StringIO("\n".join(lines)))
+
+    assert cli.main(["--workers", "1"]) == 1
+
+    captured = capsys.readouterr()
+    assert captured.err == "<stdin>:1: MemoryError: too big\n"
+    assert captured.out == "# <stdin>:2\na\n\n"
+
+
+def test_cli_draws_empty_graphs(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("{}"))
+
+    assert cli.main(["--workers", "1", "--format", "json"]) == 0
+
+    record = json.loads(capsys.readouterr().out)
+    assert record == {"name": "<stdin>:1", "ordering": [], "text_art": ""}
+
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_cli_reports_inputs_that_cannot_be_read(workers, tmp_path, monkeypatch, capsys):
+    (tmp_path / "good.txt").write_text("a b\n")
+    (tmp_path / "bad.json").write_text("{")
+    lines = [json.dumps([1, 2]), "{", json.dumps({"b": ["c"]})]
+    monkeypatch.setattr(sys, "stdin", io.StringIO("\n".join(lines)))
+    paths = [str(tmp_path / name) for name in ["missing.txt", "bad.json", "good.txt"]]
+
+    assert cli.main(["--workers", workers, *paths[:2], "-", paths[2]]) == 1
+
+    captured = capsys.readouterr()
+    names = sorted(line.split(":")[0] for line in captured.err.splitlines())
+    assert names == sorted(["<stdin>", "<stdin>", *paths[:2]])
+    assert sorted(re.findall("^# (.*)$", captured.out, re.MULTILINE)) == sorted(
+        ["<stdin>:3", paths[2]]
+    )
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (
+            'digraph { "//foo:bar" -> "//foo:baz" }',
+            {"//foo:bar": ["//foo:baz"], "//foo:baz": []},
+        ),
+        (
+            'digraph { a [URL="http://x.org"]; b -> c [color=red]; d -> e }',
+            {"a": [], "b": ["c"], "c": [], "d": ["e"], "e": []},
+        ),
+        ('digraph { "[root] a" -> b }', {"[root] a": ["b"], "b": []}),
+        ("digraph { a -> b c -> d }", {"a": ["b"], "b": [], "c": ["d"], "d": []}),
+        ("digraph { node [shape=box] a -> b }", {"a": ["b"], "b": []}),
+        ('digraph { "a=b" -> "c;d" }', {"a=b": ["c;d"], "c;d": []}),
+        (
+            'strict digraph g {\n// a -> b\n/* c -> d */ a:n -> "e\\"f":s; x=y\n}',
+            {"a": ['e"f'], 'e"f': []},
+        ),
+    ],
+)
+def test_cli_reads_dot(text, expected):
+    assert cli._from_dot(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "digraph { subgraph s { a -> b } c -> d }",
+        "graph { a -- b }",
+        "digraph { a -- b }",
+        "digraph { a -> <b> }",
+        "digraph { node a }",
+        "digraph { a -> b } c",
+        "digraph { a -> b",
+    ],
+)
+def test_cli_rejects_unsupported_dot(text, tmp_path, capsys):
+    path = tmp_path / "graph.dot"
+    path.write_text(text)
+
+    assert cli.main(["--workers", "1", str(path)]) == 1
+
+    assert capsys.readouterr().err.startswith(f"{path}: ValueError")
+
+
+@pytest.mark.parametrize("use_executor", [False, True])
+def test_async_search_lets_other_tasks_run(use_executor):
+    graph = generators.ditutte_fragment()
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        ticker = asyncio.create_task(tick())
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            ordering = await aio.sorted_topological(
+                graph, pause_every=100, executor=executor if use_executor else None
+            )
+        ticker.cancel()
+        return ordering
+
+    ordering = asyncio.run(main())
+    assert _cost(graph, ordering) == 49
+    assert len(ticks) > 10
+
+
+@pytest.mark.parametrize("use_executor", [False, True])
+def test_async_search_can_be_cancelled(use_executor):
+    graph = generators.ditutte_fragment()
+
+    async def main():
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            await asyncio.wait_for(
+                aio.sorted_topological(
+                    graph, pause_every=10, executor=executor if use_executor else None
+                ),
+                timeout=0.01,
+            )
+
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(main())
+    assert time.monotonic() - start < 0.5
+
+
+@pytest.mark.parametrize(
+    "graph", [generators.a_ring(), generators.diagv_butterfly_cyclic()]
+)
+def test_cyclic_graphs_are_ordered_by_component(graph):
+    ordering = optimization.sorted_topological(graph)
+    assert sorted(ordering) == sorted(graph)
+
+    position = {node: i for i, node in enumerate(ordering)}
+    compiled = core.compiled(graph)
+    components = compiled.strongly_connected_components()
+    node2component = {}
+    for i, component in enumerate(components):
+        positions = sorted(position[compiled.nodes[node]] for node in component)
+        assert positions == list(range(positions[0], positions[-1] + 1))
+        node2component.update((compiled.nodes[node], i) for node in component)
+    for head, tail in graph.edges:
+        if node2component[head] != node2component[tail]:
+            assert position[head] < position[tail]
+
+
+def test_wrappers_order_cyclic_graphs(tmp_path):
+    graph = generators.a_ring()
+    expected = optimization.sorted_topological(graph)
+    with cache.OrderingCache(tmp_path) as orderings:
+        assert orderings.sorted_topological(graph) == expected
+        assert orderings.get(graph) is None
+    assert asyncio.run(aio.sorted_topological(graph)) == expected
+
+
+def test_time_limit_applies_to_cyclic_graphs():
+    rng = random.Random(0)
+    graph = {i: [(i + 1) % 1000, rng.randrange(1000)] for i in range(1000)}
+    start = time.monotonic()
+    ordering = optimization.sorted_topological(graph, time_limit=0.1)
+    assert time.monotonic() - start < 1
+    assert sorted(ordering) == sorted(graph)
+
+
+@pytest.mark.parametrize(
+    "graph",
+    [
+        generators.dibull(),
+        generators.ditutte_fragment(),
+        {"a": [], "b": []},
+        {},
+    ],
+)
+def test_binary_round_trip(graph, tmp_path):
+    path = tmp_path / "graph.dgv"
+    binary.write(graph, path)
+    actual = binary.read(path)
+    expected = core.compiled(graph)
+
+    assert list(actual.nodes) == list(expected.nodes)
+    for node in range(len(expected)):
+        assert list(actual.predecessors(node)) == list(expected.predecessors(node))
+        assert list(actual.successors(node)) == list(expected.successors(node))
+    assert actual.topological_order() == expected.topological_order()
+    assert (
+        actual.strongly_connected_components()
+        == expected.strongly_connected_components()
+    )
+    if len(expected):
+        ordering = optimization.sorted_topological(actual)
+        assert ordering == optimization.sorted_topological(expected)
+        assert visualization.text_art(actual, ordering) == visualization.text_art(
+            expected, ordering
+        )
+
+
+def test_binary_rejects_labels_that_do_not_round_trip(tmp_path):
+    with pytest.raises(TypeError):
+        binary.write({("a", 1): ["b"]}, tmp_path / "graph.dgv")
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+@pytest.mark.parametrize(
+    "graph",
+    [
+        generators.dibull(),
+        generators.distar(3),
+        generators.diagv(),
+        generators.diagv_butterfly_acyclic(),
+    ],
+)
+def test_k_best_orderings_are_the_cheapest(graph, k):
+    import networkx as nx
+
+    costs = sorted(
+        _cost(graph, ordering) for ordering in nx.all_topological_sorts(graph)
+    )
+    actual = optimization.k_best_orderings(graph, k)
+    assert [cost for cost, _ in actual] == costs[:k]
+    assert len({ordering for _, ordering in actual}) == len(actual)
+    for cost, ordering in actual:
+        assert cost == _cost(graph, ordering)
+
+
+@pytest.mark.parametrize("n", [1, 2, 4])
+def test_k_best_orderings_can_skip_interchangeable_nodes(n):
+    graph = generators.distar(n)
+    assert len(optimization.k_best_orderings(graph, 100)) == math.factorial(n)
+    assert len(optimization.k_best_orderings(graph, 100, distinct=True)) == 1